@@ -90,12 +90,46 @@
 
 # Import libraries
 import argparse
+import heapq
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from numba import njit, prange
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 import time
 import sys
 import os
 
+# Components with at most this many people are solved exactly (2^EXACT_MAX_SIZE subsets)
+EXACT_MAX_SIZE = 20
+# Rows of the kinship file read at a time. Only pairs that pass the filters are kept in memory
+KINSHIP_CHUNKSIZE = 1000000
+# Values read as missing, same list pandas read_csv uses by default
+NA_VALUES = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+             "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"]
+
+# Name: read_Table 
+# Description: Reads a space delimited file with no header using the multithreaded pyarrow CSV reader. Every column
+#              is read as a string exactly as written (no type guessing, so IIDs like 001 or 1e5 stay as they are),
+#              with the same missing values as pandas.
+#
+# Parameters (2) : 1. path (str) : file path 
+#                  2. names (list) : column names
+#
+# Output : pd data frame with the given columns. dtype=str
+
+def read_Table(path,names):
+
+    table = pa_csv.read_csv(path,
+                            read_options=pa_csv.ReadOptions(column_names=names),
+                            parse_options=pa_csv.ParseOptions(delimiter=" "),
+                            convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in names},
+                                                                  null_values=NA_VALUES,strings_can_be_null=True))
+
+    return table.to_pandas()
+
 # Name: check_Pheno 
 # Description: Check if phenotype file second column contains only 3 types of values (Case value, Control Value and NA) 
 #
@@ -105,7 +139,7 @@ import os
 
 def check_Pheno(pheno):
 
-    data = pd.read_csv(pheno,header=None,names=["FID","IID","Status"],delimiter=" ")  
+    data = read_Table(pheno,["FID","IID","Status"])
     values = data.Status.unique() 
 
     if (len(values)>3) or (len(values)<1):
@@ -117,27 +151,31 @@ def check_Pheno(pheno):
 # Description: Outputs a dataframe with two columns, these samples are related to each other according to the 
 #              pihat threshold 
 #
-# Parameters (3) : 1. all_samples (pd data frame) : dataframe with two columns: FID,IID. All samples
+# Parameters (3) : 1. kinship_file (str) : path to kinship file input
+#                  2. kinship_threshold (float) : kinship threshold to consider relatedness 
+#                  3. iid_dtype (pd CategoricalDtype) : shared IID dtype, categories are all samples
 #                     we are considering. 
-#                  2. kinship_file (str) : path to kinship file input
-#                  3. kinship_threshold (float) : kinship threshold to consider relatedness 
 #
 # Output : Array : First element of array is score. Second element is how many relatives it has.
 
-# Outputs a dataframe with two columns, these samples are related to each other according to the pihat threshold. dtypes str
-def get_Related(all_samples,kinship_file,kinship_threshold):
-
-    # Load kinship file
-    kinship = pd.read_csv(kinship_file,header=None,names=["IID1","IID2","Kinship"],delimiter=" ", converters = {'Kinship': float,'IID1': str,'IID2': str})
-    # Filter kinship file so that pairs that are remaining are all in sample file
-    kinship2 = kinship[kinship.IID1.isin(all_samples.IID)]
-    kinship3 = kinship2[kinship2.IID2.isin(all_samples.IID)]
-    # Filter out by kinship threshold
-    kinship4 = kinship3[kinship3["Kinship"] >= kinship_threshold ]
-    # Filter the Kinship column out
-    kinship5 = kinship4[["IID1", "IID2"]]
-
-    return kinship5
+# Outputs a dataframe with two columns, these samples are related to each other according to the pihat threshold. dtypes category
+def get_Related(kinship_file,kinship_threshold,iid_dtype):
+
+    # Hashed index of the IIDs we are considering
+    keep = iid_dtype.categories
+    parts = []
+    # Load kinship file one chunk at a time (the pyarrow reader can't stream chunks into pandas). IIDs are read as
+    # text exactly as written, like read_Table does for the sample file, so they match the categories of iid_dtype
+    for kinship in pd.read_csv(kinship_file,header=None,names=["IID1","IID2","Kinship"],delimiter=" ",dtype={'IID1': str,'IID2': str,'Kinship': np.float64},chunksize=KINSHIP_CHUNKSIZE):
+        # Filter out by kinship threshold first, so only the survivors are looked up
+        kinship = kinship.loc[kinship.Kinship.values >= kinship_threshold,["IID1","IID2"]]
+        # Keep pairs where both IIDs are in the sample file. keep caches its hash table, so get_indexer reuses it
+        # for every chunk (Series.isin would rebuild it on every call)
+        mask = (keep.get_indexer(kinship.IID1) >= 0) & (keep.get_indexer(kinship.IID2) >= 0)
+        # Survivors are all in the sample file, so they can take the shared categorical dtype
+        parts.append(kinship.loc[mask].astype(iid_dtype))
+
+    return pd.concat(parts)
 
 # Name: get_Strict_Unrelated 
 # Description: Outputs a dataframe with one column, whom are individuals who are not related to anyone 
@@ -164,166 +202,420 @@ def get_Strict_Unrelated(related_people,all_samples):
 #
 # Parameters (3) : 1. pheno_file (str): input phenotype file path 
 #                  2. related people (pd data frame) : data frame created with two columns: IID1,IID2
-#                     These are related pairs of people.  
-#                  3. all_samples (pd data frame): dataframe with two columns: FID,IID. All samples 
-#                     we are considering
+#                     These are related pairs of people. dtype category
+#                  3. iid_dtype (pd CategoricalDtype) : shared IID dtype built from all_samples. Only samples
+#                     in its categories are kept
 #
-# Output : pd data frame with two columns (IID Status) dtype=str 
+# Output : pd data frame with two columns (IID Status) dtype IID=category, Status=str 
 
-def get_Pheno(pheno_file,related_people,all_samples):
+def get_Pheno(pheno_file,related_people,iid_dtype):
    
     # Load pheno file
-    pheno = pd.read_csv(pheno_file,header=None,names=["FID","IID","Status"],delimiter=" ",dtype=str)  
-    # Extract column of related people and turn into an array
-    first = related_people['IID1'].to_numpy()
-    second = related_people['IID2'].to_numpy()
-    merged = np.concatenate((first, second), axis=None)
-    unique_merged=np.unique(merged)
+    pheno = read_Table(pheno_file,["FID","IID","Status"])
+    # Drop samples we are not considering so the rest can take the shared categorical dtype. get_indexer reuses
+    # the cached hash table of the categories (Series.isin would rebuild it)
+    pheno = pheno[iid_dtype.categories.get_indexer(pheno['IID']) >= 0].astype({'IID': iid_dtype})
+    # Extract category codes of related people and turn into an array (integer sort, no string compares)
+    first = related_people['IID1'].cat.codes.to_numpy()
+    second = related_people['IID2'].cat.codes.to_numpy()
+    unique_merged = np.unique(np.concatenate((first, second), axis=None))
     # Convert array to dataframe
-    list_related = pd.DataFrame(unique_merged, columns = ['IID'],dtype=str)
-    # Merge
+    list_related = pd.DataFrame({'IID': pd.Categorical.from_codes(unique_merged,dtype=iid_dtype)})
+    # Merge. Both IID columns share the categorical dtype, so this joins on the integer codes
     joined = pd.merge(list_related,pheno,on='IID',how='left')
-    joined_filter = joined[["IID","Status"]]
-    # Make sure our pheno file only contains samples from all_samples subset list
-    joined_filter2 = joined_filter[joined_filter['IID'].isin(all_samples.IID)]
-    
-    return joined_filter2
 
-# Name: dict_Pheno 
-# Description: Exporting phenotype file into a dictionary 
+    return joined[["IID","Status"]]
+
+# Name: array_Pheno 
+# Description: Exporting phenotype file into an int8 array indexed like the adjacency list
 #              
 #
-# Parameters (2) : 1. phenotype (pd dataframe) : phenotype dataframe generated beforehand 
+# Parameters (3) : 1. phenotype (pd dataframe) : phenotype dataframe generated beforehand 
 #                  2. case_value (string) : user-inputted value designating case
+#                  3. uniques (pd Index) : IID of each index, generated by get_Adjacency
 #
-# Output : Dictionary : key is IID, value is phenotype status 
+# Output : np array (int8) : phenotype status of each index. 1 case, 0 control, -1 NA 
 
-def dict_Pheno(phenotype,case_value):
+def array_Pheno(phenotype,case_value,uniques):
 
-    pheno_dict={} 
-    # Processing Phenotype Dataframe, one row at a time. 
-    for index, row in phenotype.iterrows():
-        if (row['Status'] == case_value):
-            result = int(1)
-        elif (pd.isnull(row['Status'])):
-            result = "NA"
-        else:
-            result = int(0)
-        # Check to see if multiple pheno entries per IID
-        if row['IID'] in pheno_dict:
-            print("Single IID corresponds to multiple phenotype values... Stopping Script!")
-            sys.exit()
-        # Add to dictionary
-        pheno_dict[row['IID']] = result
+    # Check to see if multiple pheno entries per IID
+    if phenotype['IID'].duplicated().any():
+        print("Single IID corresponds to multiple phenotype values... Stopping Script!")
+        sys.exit()
+    # Index of each IID in the adjacency list
+    codes = uniques.get_indexer(phenotype['IID'])
+    status = phenotype['Status']
+    # Whole column at once: 1 case, 0 control, -1 NA
+    result = np.where(status.isna(),-1,np.where(status == case_value,1,0)).astype(np.int8)
+    # Anyone without a phenotype stays NA
+    pheno_arr = np.full(len(uniques),-1,dtype=np.int8)
+    pheno_arr[codes[codes >= 0]] = result[codes >= 0]
+
+    return pheno_arr
+
+# Name: get_Adjacency 
+# Description: Builds a CSR style adjacency list of the related pairs. Every related IID is mapped to an 
+#              integer index i, and the relatives of i are the contiguous slice indices[indptr[i]:indptr[i+1]]
+#
+# Parameters (1) : 1. related_people (pd data frame) : data frame created with two columns: IID1,IID2
+#                     These are related pairs of people. dtype category
+#
+# Output : Tuple : (indptr, indices, uniques). uniques[i] is the IID of index i.
+
+def get_Adjacency(related_people):
+
+    # Map each related IID to an integer index (ordered like the sample file)
+    first = related_people['IID1'].cat.codes.to_numpy()
+    second = related_people['IID2'].cat.codes.to_numpy()
+    codes, unique_codes = pd.factorize(np.concatenate((first, second), axis=None),sort=True)
+    uniques = related_people['IID1'].cat.categories[unique_codes]
+    # Each pair goes both ways: (IID1 -> IID2) and (IID2 -> IID1)
+    num_pairs = len(first)
+    source = codes
+    target = np.concatenate((codes[num_pairs:], codes[:num_pairs]), axis=None)
+    # Group the relatives of each index together. Stable sort keeps the pairs in file order
+    order = np.argsort(source,kind='stable')
+    indices = target[order].astype(np.int32)
+    indptr = np.searchsorted(source[order],np.arange(len(uniques)+1)).astype(np.int32)
+
+    return (indptr, indices, uniques)
+
+# Name: get_Components 
+# Description: Splits the related pairs into connected components (families). People in different components
+#              are not related to each other, so every component can be solved on its own.
+#
+# Parameters (2) : 1. indptr (np array) : CSR offsets generated by get_Adjacency 
+#                  2. indices (np array) : CSR relatives generated by get_Adjacency 
+#
+# Output : Tuple : (comp_ptr, comp_nodes). The indices in component c are comp_nodes[comp_ptr[c]:comp_ptr[c+1]]
+
+def get_Components(indptr,indices):
 
-    return pheno_dict
+    n = len(indptr)-1
+    graph = csr_matrix((np.ones(len(indices),dtype=np.int8),indices,indptr),shape=(n,n))
+    num_comp, labels = connected_components(graph,directed=False)
+    # Group the indices of each component together
+    comp_nodes = np.argsort(labels,kind='stable').astype(np.int32)
+    comp_ptr = np.searchsorted(labels[comp_nodes],np.arange(num_comp+1)).astype(np.int32)
 
-# Name: calculate_score 
-# Description: Calculates a Score for a case individual. For each
-#              other case individual this person is related to, score +1.
+    return (comp_ptr, comp_nodes)
+
+# Name: make_kernel 
+# Description: Builds a numba compiled function counting how many of a list of people are alive and have
+#              the target status. target is baked in when the function is built, so the comparison is against 
+#              a constant and compiles to a branch free loop.
 #
-# Parameters (3) : 1. ID (string) : IID of person 
-#                  2. phenotype_dict (dictionary) : Dictionary Containing phenotype information 
-#                  3. relatedness_df (pandas dataframe): Dataframe containing our related pairs 
+# Parameters (1) : 1. target (int) : phenotype status to count (1 cases, 0 controls, -1 NAs)
 #
-# Output : Array : First element of array is score. Second element is how many relatives it has.
+# Output : numba function (pheno, alive, list_related) -> int
 
-def calculate_score(ID,phenotype_dict,relatedness_df):
-    #array to output
-    output_array=[]
-    
-    #search up ID in the relatedness df and add to the list_related everyone this person is related to
-    ID=str(ID)
-    x=relatedness_df[relatedness_df.IID1 == ID]
-    l1 = x["IID2"].tolist()
-    x=relatedness_df[relatedness_df.IID2 == ID]
-    l2 = x["IID1"].tolist()
-    list_related=l1+l2
-    
-    score=0
-    # Go through this list and calculate score
-    for i in range(0,len(list_related)):
-        case=phenotype_dict[str(list_related[i])]
-        if (case==1):
-            score=score+1
-    
-    # Prepare output array
-    output_array.append(score)
-    output_array.append(len(list_related))
-    
-    return (output_array)
-    
+def make_kernel(target):
+
+    @njit(cache=True)
+    def count_status(pheno,alive,list_related):
+        score = 0
+        for i in range(len(list_related)):
+            score += alive[list_related[i]] & (pheno[list_related[i]] == target)
+        return score
 
-# Name: calculate_score_controls
-# Description: Calculates a Score for a control individual. For each
-#              other control individual this person is related to, score +1.
+    return count_status
+
+count_cases = make_kernel(1)
+count_controls = make_kernel(0)
+count_nas = make_kernel(-1)
+
+# Name: select_zero_score 
+# Description: Selects every case who is not related to any other case, compiled with numba. First pass scores
+#              all cases, second pass selects the cases with a score of 0 and removes everyone they are related
+#              to (no cases, since the score is 0). Removing them changes no other case's score, so one sweep
+#              over the adjacency list is enough.
 #
-# Parameters (3) : 1. ID (string) : IID of person 
-#                  2. phenotype_dict (dictionary) : Dictionary Containing phenotype information 
-#                  3. relatedness_df (pandas dataframe): Dataframe containing our related pairs 
+# Parameters (4) : 1. indptr (np array) : CSR offsets generated by get_Adjacency 
+#                  2. indices (np array) : CSR relatives generated by get_Adjacency 
+#                  3. pheno (np array) : int8 phenotype status of each index (1 case, 0 control, -1 NA)
+#                  4. alive (np array) : boolean, True for people who can still be selected. Updated in place
 #
-# Output : Array : First element of array is score. Second element is how many relatives it has.
+# Output : np array of the indices selected
+
+@njit(cache=True)
+def select_zero_score(indptr,indices,pheno,alive):
+
+    n = len(pheno)
+    score = np.zeros(n,dtype=np.int32)
+    for i in range(n):
+        if pheno[i] == 1:
+            score[i] = count_cases(pheno,alive,indices[indptr[i]:indptr[i+1]])
+
+    output = np.empty(n,dtype=np.int32)
+    count = 0
+    for i in range(n):
+        if pheno[i] == 1 and score[i] == 0:
+            output[count] = i
+            count += 1
+            alive[i] = False
+            for p in range(indptr[i],indptr[i+1]):
+                alive[indices[p]] = False
+
+    return output[:count]
+
+# Name: deactivate 
+# Description: Removes index k and updates the live relatives left behind, compiled with numba. Each relative 
+#              of the target status has 1 less relative, and 1 less point if k had the target status too. This 
+#              way we don't have to recalculate the score for everyone! Updated entries are pushed to the heap.
+#
+# Parameters (10) : 1. k (int) : index of person to remove
+#                   2. indptr (np array) : CSR offsets generated by get_Adjacency 
+#                   3. indices (np array) : CSR relatives generated by get_Adjacency 
+#                   4. pheno (np array) : int8 phenotype status of each index (1 case, 0 control, -1 NA)
+#                   5. target (int) : phenotype status we are selecting
+#                   6. alive (np array) : boolean, True for people who can still be selected. Updated in place
+#                   7. score (np array) : score of each position in the component. Updated in place
+#                   8. num_relative (np array) : live relatives of each position in the component. Updated in place 
+#                   9. local (np array) : position of each index within the component
+#                  10. heap (list) : min-heap of (score, number of relatives, index). Updated in place
+#
+# Output : None
+
+@njit(cache=True)
+def deactivate(k,indptr,indices,pheno,target,alive,score,num_relative,local,heap):
+
+    alive[k] = False
+    for p in range(indptr[k],indptr[k+1]):
+        j = indices[p]
+        if alive[j] and pheno[j] == target:
+            num_relative[local[j]] -= 1
+            if pheno[k] == target:
+                score[local[j]] -= 1
+            heapq.heappush(heap,(score[local[j]],num_relative[local[j]],j))
+
+# Name: greedy_select 
+# Description: Greedy selection for one phenotype status within one component, compiled with numba. Repeatedly
+#              selects the remaining person of the target status with the lowest score (number of related people
+#              with the same status), then fewest relatives, then lowest index, and removes everyone related to 
+#              them. Repeat until noone of the target status is left.
+#
+# Parameters (7) : 1. indptr (np array) : CSR offsets generated by get_Adjacency 
+#                  2. indices (np array) : CSR relatives generated by get_Adjacency 
+#                  3. pheno (np array) : int8 phenotype status of each index (1 case, 0 control, -1 NA)
+#                  4. target (int) : phenotype status we are selecting
+#                  5. alive (np array) : boolean, True for people who can still be selected. Pairs with someone
+#                     who is not alive no longer count. Updated in place
+#                  6. nodes (np array) : indices of everyone in the component
+#                  7. local (np array) : position of each index within nodes, local[nodes[a]] == a
+#
+# Output : np array of the indices selected, in the order they were selected
 
-def calculate_score_controls(ID,phenotype_dict,relatedness_df):
-    #array to output
-    output_array=[]
-    
-    #search up ID in the relatedness df and add to the list_related everyone this person is related to
-    ID=str(ID)
-    x=relatedness_df[relatedness_df.IID1 == ID]
-    l1 = x["IID2"].tolist()
-    x=relatedness_df[relatedness_df.IID2 == ID]
-    l2 = x["IID1"].tolist()
-    list_related=l1+l2
-    
-    score=0
-    # Go through this list and calculate score
-    for i in range(0,len(list_related)):
-        case=phenotype_dict[str(list_related[i])]
-        if (case==0):
-            score=score+1
-
-    # Prepare output array
-    output_array.append(score)
-    output_array.append(len(list_related))
-    
-    return(output_array)
-    
+@njit(cache=True)
+def greedy_select(indptr,indices,pheno,target,alive,nodes,local):
+
+    m = len(nodes)
+    score = np.zeros(m,dtype=np.int32)
+    num_relative = np.zeros(m,dtype=np.int32)
 
-# Name: calculate_score_nas
-# Description: Calculates a Score for an NA individual. For each
-#              other na individual this person is related to, score +1.
+    # First, Calculate Scores:
+    for i in nodes:
+        if alive[i] and pheno[i] == target:
+            list_related = indices[indptr[i]:indptr[i+1]]
+            for j in list_related:
+                if alive[j]:
+                    num_relative[local[i]] += 1
+            if target == 1:
+                score[local[i]] = count_cases(pheno,alive,list_related)
+            elif target == 0:
+                score[local[i]] = count_controls(pheno,alive,list_related)
+            else:
+                score[local[i]] = count_nas(pheno,alive,list_related)
+
+    # Min-heap of (score, number of relatives, index) so the next person is found in O(log N). Entries are never
+    # removed from the heap: stale ones (person no longer alive, or score changed since the push) are skipped when popped
+    heap = []
+    for i in nodes:
+        if alive[i] and pheno[i] == target:
+            heap.append((score[local[i]],num_relative[local[i]],i))
+    if len(heap) > 0:
+        heapq.heapify(heap)
+
+    output = np.empty(len(heap),dtype=np.int32)
+    count = 0
+    while len(heap) > 0:
+
+        min_score, min_rel, min_k = heapq.heappop(heap)
+        if not alive[min_k] or min_score != score[local[min_k]] or min_rel != num_relative[local[min_k]]:
+            continue
+
+        # eliminate min_k. Everyone related to him is removed with him, so there are no scores to update
+        output[count] = min_k
+        count += 1
+        alive[min_k] = False
+
+        #Deal with eliminating min_k's pair
+        for p in range(indptr[min_k],indptr[min_k+1]):
+            j = indices[p]
+            if alive[j]:
+                deactivate(j,indptr,indices,pheno,target,alive,score,num_relative,local,heap)
+
+    return output[:count]
+
+# Name: exact_select 
+# Description: Exact selection within one small component, compiled with numba. Goes through every subset of the
+#              people still alive and keeps the unrelated subset with the most cases, then most controls, then
+#              most NAs.
 #
-# Parameters (3) : 1. ID (string) : IID of person 
-#                  2. phenotype_dict (dictionary) : Dictionary Containing phenotype information 
-#                  3. relatedness_df (pandas dataframe): Dataframe containing our related pairs 
+# Parameters (6) : 1. indptr (np array) : CSR offsets generated by get_Adjacency 
+#                  2. indices (np array) : CSR relatives generated by get_Adjacency 
+#                  3. pheno (np array) : int8 phenotype status of each index (1 case, 0 control, -1 NA)
+#                  4. alive (np array) : boolean, True for people who can still be selected. Updated in place
+#                  5. nodes (np array) : indices of everyone in the component
+#                  6. local (np array) : scratch space, overwritten for the indices in nodes
 #
-# Output : Array : First element of array is score. Second element is how many relatives it has.
-
-def calculate_score_nas(ID,phenotype_dict,relatedness_df):
-    #array to output
-    output_array=[]
-    
-    #search up ID in the relatedness df and add to the list_related everyone this person is related to
-    ID=str(ID)
-    x=relatedness_df[relatedness_df.IID1 == ID]
-    l1 = x["IID2"].tolist()
-    x=relatedness_df[relatedness_df.IID2 == ID]
-    l2 = x["IID1"].tolist()
-    list_related=l1+l2
-    
-    score=0
-    # Go through this list and calculate score
-    for i in range(0,len(list_related)):
-        case=phenotype_dict[str(list_related[i])]
-        if (case=="NA"):
-            score=score+1
-
-    # Prepare output array
-    output_array.append(score)
-    output_array.append(len(list_related))
-    
-    return(output_array)
+# Output : np array of the indices selected
+
+@njit(cache=True)
+def exact_select(indptr,indices,pheno,alive,nodes,local):
+
+    # People still alive in the component, numbered 0..m-1
+    members = nodes[alive[nodes]]
+    m = len(members)
+    for a in range(m):
+        local[members[a]] = a
+
+    # Relatives of each member as a bitmask, and a weight so that one case outweighs any number of controls,
+    # and one control outweighs any number of NAs
+    related = np.zeros(m,dtype=np.int64)
+    weight = np.zeros(m,dtype=np.int64)
+    for a in range(m):
+        i = members[a]
+        for p in range(indptr[i],indptr[i+1]):
+            j = indices[p]
+            if alive[j]:
+                related[a] |= np.int64(1) << local[j]
+        if pheno[i] == 1:
+            weight[a] = (m+1)*(m+1)
+        elif pheno[i] == 0:
+            weight[a] = m+1
+        else:
+            weight[a] = 1
+
+    # total[mask] is the weight of subset mask, or -1 if two people in it are related. Every subset whose
+    # highest member is a extends a smaller subset that was already scored
+    total = np.zeros(1 << m,dtype=np.int64)
+    best_mask = 0
+    for a in range(m):
+        bit = 1 << a
+        for rest in range(bit):
+            if total[rest] < 0 or (related[a] & rest) != 0:
+                total[bit | rest] = -1
+            else:
+                total[bit | rest] = total[rest] + weight[a]
+                if total[bit | rest] > total[best_mask]:
+                    best_mask = bit | rest
+
+    # Select the best subset and remove everyone in the component
+    output = np.empty(m,dtype=np.int32)
+    count = 0
+    for a in range(m):
+        if (best_mask >> a) & 1:
+            output[count] = members[a]
+            count += 1
+        alive[members[a]] = False
+
+    return output[:count]
+
+# Name: min_degree_select 
+# Description: Selection within one component where everyone still alive has the same phenotype status, compiled
+#              with numba. Scores would just equal number of relatives, so no scoring is needed: repeatedly selects 
+#              the person with the fewest live relatives, then lowest index, and removes everyone related to them.
+#
+# Parameters (5) : 1. indptr (np array) : CSR offsets generated by get_Adjacency 
+#                  2. indices (np array) : CSR relatives generated by get_Adjacency 
+#                  3. alive (np array) : boolean, True for people who can still be selected. Updated in place
+#                  4. nodes (np array) : indices of everyone in the component
+#                  5. local (np array) : position of each index within nodes, local[nodes[a]] == a
+#
+# Output : np array of the indices selected, in the order they were selected
+
+@njit(cache=True)
+def min_degree_select(indptr,indices,alive,nodes,local):
+
+    num_relative = np.zeros(len(nodes),dtype=np.int32)
+    heap = []
+    for i in nodes:
+        if alive[i]:
+            for p in range(indptr[i],indptr[i+1]):
+                if alive[indices[p]]:
+                    num_relative[local[i]] += 1
+            heap.append((num_relative[local[i]],i))
+    if len(heap) > 0:
+        heapq.heapify(heap)
+
+    output = np.empty(len(heap),dtype=np.int32)
+    count = 0
+    while len(heap) > 0:
+
+        min_rel, min_k = heapq.heappop(heap)
+        if not alive[min_k] or min_rel != num_relative[local[min_k]]:
+            continue
+
+        # eliminate min_k and everyone related to him. Their live relatives have 1 less relative
+        output[count] = min_k
+        count += 1
+        alive[min_k] = False
+        for p in range(indptr[min_k],indptr[min_k+1]):
+            j = indices[p]
+            if alive[j]:
+                alive[j] = False
+                for q in range(indptr[j],indptr[j+1]):
+                    r = indices[q]
+                    if alive[r]:
+                        num_relative[local[r]] -= 1
+                        heapq.heappush(heap,(num_relative[local[r]],r))
+
+    return output[:count]
+
+# Name: solve_Components 
+# Description: Selects an unrelated subset from every component, compiled with numba. Components with at most
+#              EXACT_MAX_SIZE people still alive are solved exactly with exact_select. Larger ones where everyone
+#              alive has the same status go through min_degree_select, the rest through greedy_select for cases,
+#              then controls, then NAs (skipping statuses nobody alive has). Components are solved in parallel:
+#              each one only reads and writes the entries of its own indices.
+#
+# Parameters (6) : 1. comp_ptr (np array) : component offsets generated by get_Components
+#                  2. comp_nodes (np array) : indices grouped by component, generated by get_Components
+#                  3. indptr (np array) : CSR offsets generated by get_Adjacency 
+#                  4. indices (np array) : CSR relatives generated by get_Adjacency 
+#                  5. pheno (np array) : int8 phenotype status of each index (1 case, 0 control, -1 NA)
+#                  6. alive (np array) : boolean, True for people who can still be selected. Updated in place
+#
+# Output : np array (bool) : True for each index selected
+
+@njit(cache=True,parallel=True)
+def solve_Components(comp_ptr,comp_nodes,indptr,indices,pheno,alive):
+
+    chosen = np.zeros(len(pheno),dtype=np.bool_)
+    local = np.empty(len(pheno),dtype=np.int32)
+    for c in prange(len(comp_ptr)-1):
+        nodes = comp_nodes[comp_ptr[c]:comp_ptr[c+1]]
+        # Count cases, controls and NAs still alive in the component
+        statuses = pheno[nodes[alive[nodes]]]
+        num_cases = np.count_nonzero(statuses == 1)
+        num_controls = np.count_nonzero(statuses == 0)
+        num_nas = len(statuses) - num_cases - num_controls
+        if len(statuses) <= EXACT_MAX_SIZE:
+            chosen[exact_select(indptr,indices,pheno,alive,nodes,local)] = True
+            continue
+        for a in range(len(nodes)):
+            local[nodes[a]] = a
+        if num_cases == len(statuses) or num_controls == len(statuses) or num_nas == len(statuses):
+            chosen[min_degree_select(indptr,indices,alive,nodes,local)] = True
+            continue
+        if num_cases > 0:
+            chosen[greedy_select(indptr,indices,pheno,1,alive,nodes,local)] = True
+        if num_controls > 0:
+            chosen[greedy_select(indptr,indices,pheno,0,alive,nodes,local)] = True
+        if num_nas > 0:
+            chosen[greedy_select(indptr,indices,pheno,-1,alive,nodes,local)] = True
+
+    return chosen
 
 def main(args):
 
@@ -367,17 +659,16 @@ def main(args):
     check_Pheno(args.pheno)
 
     # Load Samples and print total number of samples
-    all_samples = pd.read_csv(args.samples,header=None,names=["FID","IID"],delimiter=" ",dtype=str)
+    all_samples = read_Table(args.samples,["FID","IID"])
+    # Shared IID dtype for every table, so joins and lookups compare category codes instead of strings
+    iid_cat = pd.CategoricalDtype(all_samples.IID.unique())
     print(f'Total number of samples: {len(all_samples.index)}')
     
     # Generate a Table of the related People. Output a pandas dataframe with two columns IID1 and IID2 in which individuals are related 
     # to each other. 
-    # dtype str 
-    related_people = get_Related(all_samples,args.kinship,kinship)
+    # dtype category 
+    related_people = get_Related(args.kinship,kinship,iid_cat)
     print(f'Number of related pairs: {len(related_people.index)}')
-    # Make sure both columns are strings
-    related = related_people.applymap(str)
-    
 
     # Generate a Table of people who are not related to anyone based on pihat value
     # dtype = str
@@ -386,30 +677,20 @@ def main(args):
 
     # Filter out phenotype file and make sure that all samples we are running the script on has phenotypes
     # If sample doesn't have phenotype, impute NA. Also subset this pheno list to subjects in the all samples list. 
-    # dtype = str
-    final_pheno = get_Pheno(args.pheno,related_people,all_samples)
+    # dtype IID=category, Status=str
+    final_pheno = get_Pheno(args.pheno,related_people,iid_cat)
     print(f'Number of people who have relatedness: {len(final_pheno.index)}')
  
-    # Make a phenotype dictionary where key is ID and maps to phenotype status
-    phenotype = dict_Pheno(final_pheno,args.case_value)
-
-    # Establish list of cases, this is the list I use, and when this list is empty I'm done
-    list_cases=[]
-    for i, k in enumerate(phenotype):
-        if (phenotype[k]==1):
-            list_cases.append(k)
-            
-    # Establish list of controls.
-    list_controls=[]
-    for i, k in enumerate(phenotype):
-        if (phenotype[k]==0):
-            list_controls.append(k)
-
-    # Establish list of NA's.
-    list_nas=[]
-    for i, k in enumerate(phenotype):
-        if (phenotype[k]=="NA"):
-            list_nas.append(k)
+    # Build the adjacency list of related pairs once. From here on everyone is referred to by their index,
+    # uniques maps an index back to IID
+    indptr, indices, uniques = get_Adjacency(related_people)
+    # Make a phenotype array where index maps to phenotype status: 1 case, 0 control, -1 NA
+    phenotype = array_Pheno(final_pheno,args.case_value,uniques)
+
+    # Establish list of cases, controls and NA's straight from the phenotype array.
+    list_cases = np.flatnonzero(phenotype==1)
+    list_controls = np.flatnonzero(phenotype==0)
+    list_nas = np.flatnonzero(phenotype==-1)
 
 
     # Print out Original List of cases, controls and NAs.
@@ -421,266 +702,55 @@ def main(args):
     print(f'Original Number of NAs: {len(list_nas)}')
     print("")
 
-    new_score=dict()
-    # Go through list of cases, calculate score for the cases and include all cases that have a score of 0. Update
-    # related file by removing these pairs. 
-    for i in range(0,len(list_cases)):
-        arr=calculate_score(list_cases[i],phenotype,related)
-        x=int(arr[0])
-        new_score[str(list_cases[i])]=x
+    # Everyone starts out alive. Selected people, and everyone related to them, are no longer alive: their pairs
+    # are dropped and they can't be selected
+    alive = np.ones(len(uniques),dtype=bool)
 
-
-    # Remove all scores of 0 and update related list (remove row where you see the person you removed). For list cases, remove all
-    # scores of 0 and look at the people it was related to. Remove them if they are on the list cases list.
+    # Select all cases with a score of 0 (not related to any other case) and remove everyone they are related to.
     # Add array is a list of people who we will eventually add to the list to use
+    add_array = select_zero_score(indptr,indices,phenotype,alive)
 
-    add_array=[]
-
-    for i, k in enumerate(new_score):
-        if (new_score[k]==0):
-            add_array.append(k)
-            list_cases.remove(k)
-            
-            ID=str(k)
-            x=related[related.IID1 == ID]
-            l1 = x["IID2"].tolist()
-            x=related[related.IID2 == ID]
-            l2 = x["IID1"].tolist()
-            list_related=l1+l2
-            
-            #Remove those who are on related to the selection from list_controls or list_nas
-            for i in range(0,len(list_related)):
-                if list_related[i] in list_controls:
-                    list_controls.remove(list_related[i])
-                if list_related[i] in list_nas:
-                    list_nas.remove(list_related[i])
-            index = related[ related['IID1'] == k ].index
-            related.drop(index , inplace=True)
-            index = related[ related['IID2'] == k ].index
-            related.drop(index , inplace=True)
-
-    # List of global variables:
-
-    # new_score=dict of scores of cases at the moment
-    # add_array = list of people who can be used (output list)
-    # phenotype = phenotype status 
-    # related = related pairs status (This will be changed every iteration)
-    # list_cases = people who are cases, calculated before. Will keep removing people. Algorithm finishes when everyone is removed from this list.
-    # list_controls= people who are controls
-    # list_nas = people who are nas
-
-    # Use a while loop to loop through list_cases, until list_cases is empty.
-    # Use the Scoring dictionary. Choose someone with the lowest score and add him to add array and remove him, updating related list,
-    # list_cases. Update Scores. Repeat until noone is left in List Cases
-
-    new_score=dict()
-    num_relative=dict()
+    # List of global variables, all plain contiguous arrays. The selection below only reads and writes these:
 
-    # First, Calculate Scores:
-    for i in range(0,len(list_cases)):
-        arr=calculate_score(list_cases[i],phenotype,related)
-        x=int(arr[0])
-        new_score[str(list_cases[i])]=x
-        num_relative[str(list_cases[i])]=int(arr[1])
+    # add_array = indices of people who can be used (output list)
+    # phenotype = int8 phenotype status (1 case, 0 control, -1 NA)
+    # indptr, indices = int32 related pairs (adjacency list)
+    # comp_ptr, comp_nodes = int32 components
+    # alive = bool, people who can still be selected (This will be changed every iteration)
 
-    while(len(list_cases)>0):
-        
-        max_value=1000000000
-        max_k=""
-        max_rel=100000000000
-        for i in range (0,len(list_cases)):
-            k=list_cases[i]
-            if (new_score[k]<=max_value and num_relative[k]<max_rel):
-                max_value=new_score[k]
-                max_k=k
-                max_rel=num_relative[k]
-
-        #Deal with eliminating max_k's pair
-        ID=str(max_k)
-        x=related[related.IID1 == ID]
-        l1 = x["IID2"].tolist()
-        x=related[related.IID2 == ID]
-        l2 = x["IID1"].tolist()
-        list_related=l1+l2
-
-        for i in range(0,len(list_related)):
-            
-            #Remove those who are on related to the selection from both lists    
-            if (phenotype[list_related[i]]==1):
-                if list_related[i] in list_cases:
-                    
-                    # We need to access everyone in list_related and change their score
-                    # They have 1 less point because one less case pair. Also have 1 less relative
-                    # This way we don't have to recalculate the score for everyone!
-                    new_score[str(list_related[i])]=new_score[str(list_related[i])]-1
-                    num_relative[str(list_related[i])]=num_relative[str(list_related[i])]-1
-                    list_cases.remove(list_related[i])
-                    
-            if (phenotype[list_related[i]]==0):
-                if list_related[i] in list_controls:
-                    list_controls.remove(list_related[i])
-            if (phenotype[list_related[i]]=="NA"):
-                 if list_related[i] in list_nas:
-                    list_nas.remove(list_related[i])
-
-        # eliminate max_k
-        add_array.append(max_k)
-        list_cases.remove(str(max_k))
-        index = related[ related['IID1'] == max_k ].index
-        related.drop(index , inplace=True)
-        index = related[ related['IID2'] == max_k ].index
-        related.drop(index , inplace=True)
+    # People in different components (families) are not related, so each component is solved on its own.
+    # Small components are solved exactly, larger ones choose the case with the lowest score, add him and remove him
+    # and everyone related to him, update scores, repeat until noone is left. Then the same for controls and NAs.
+    comp_ptr, comp_nodes = get_Components(indptr,indices)
+    chosen = solve_Components(comp_ptr,comp_nodes,indptr,indices,phenotype,alive)
+    chosen[add_array] = True
+    chosen = np.flatnonzero(chosen)
 
+    add_array = chosen[phenotype[chosen]==1]
     print(f'Number of Cases Selected: {len(add_array)}')
 
     # Deal with Controls 
-
-    # Use a while loop to loop through list_controls, until list_controls is empty.
-    # Use the Scoring dictionary. Choose someone with the lowest score and add him to second add array and remove him, updating related list,
-    # list_controls. Update Scores. Repeat until noone is left in List Controls
-
-    second_add_array=[]
-    new_score=dict()
-    num_relative=dict()
-        
-    # Go through list of cases, calculate score for the cases.Update related file by removing these pairs. 
-    for i in range(0,len(list_controls)):
-        arr=calculate_score_controls(list_controls[i],phenotype,related)
-        x=int(arr[0])
-        new_score[str(list_controls[i])]=x
-        num_relative[str(list_controls[i])]=int(arr[1])
-
-    while(len(list_controls)>0):
-        
-        max_value=1000000000000
-        max_k=""
-        max_rel=100000000000
-        for i in range (0,len(list_controls)):
-            k=list_controls[i]
-            if (new_score[k]<=max_value and num_relative[k]<max_rel):
-                max_value=new_score[k]
-                max_k=k
-                max_rel=num_relative[k]
-                
-        #Deal with eliminating max_k's pair
-        ID=str(max_k)
-        x=related[related.IID1 == ID]
-        l1 = x["IID2"].tolist()
-        x=related[related.IID2 == ID]
-        l2 = x["IID1"].tolist()
-        list_related=l1+l2
-        
-        for i in range(0,len(list_related)):
-        
-            #Remove those who are on related to the selection from both lists
-            if (phenotype[list_related[i]]==1):
-                if list_related[i] in list_cases:
-                    list_cases.remove(list_related[i])
-                    print("should never be ran")
-            if (phenotype[list_related[i]]==0):
-                if list_related[i] in list_controls:
-                    list_controls.remove(list_related[i])
-                    # We need to access everyone in list_related and change their score
-                    # They have 1 less point because one less case pair. Also have 1 less relative
-                    # This way we don't have to recalculate the score for everyone! 
-                    new_score[str(list_related[i])]=new_score[str(list_related[i])]-1
-                    num_relative[str(list_related[i])]=num_relative[str(list_related[i])]-1
-            if (phenotype[list_related[i]]=="NA"):
-                 if list_related[i] in list_nas:
-                    list_nas.remove(list_related[i])
-
-        # eliminate max_k
-        second_add_array.append(max_k)
-        list_controls.remove(str(max_k))
-        index = related[ related['IID1'] == max_k ].index
-        related.drop(index , inplace=True)
-        index = related[ related['IID2'] == max_k ].index
-        related.drop(index , inplace=True)
+    second_add_array = chosen[phenotype[chosen]==0]
 
     print("")
     print(f'Number of Controls Selected: {len(second_add_array)}')
     print("")
 
     # Deal with NAs 
-
-    # Use a while loop to loop through list_nas, until list_nas is empty.
-    # Use the Scoring dictionary. Choose someone with the lowest score and add him to the third add array and remove him, updating related list,
-    # list_nas. Update Scores. Repeat until noone is left in List Nas
-
-    third_add_array=[]
-    new_score=dict()
-    num_relative=dict()
-        
-    # Go through list of cases, calculate score for the cases.Update related file by removing these pairs. 
-    for i in range(0,len(list_nas)):
-        arr=calculate_score_nas(list_nas[i],phenotype,related)
-        x=int(arr[0])
-        new_score[str(list_nas[i])]=x
-        num_relative[str(list_nas[i])]=int(arr[1])
-
-    while(len(list_nas)>0):
-        
-        max_value=1000000000000
-        max_k=""
-        max_rel=100000000000
-        for i in range (0,len(list_nas)):
-            k=list_nas[i]
-            if (new_score[k]<=max_value and num_relative[k]<max_rel):
-                max_value=new_score[k]
-                max_k=k
-                max_rel=num_relative[k]
-
-        #Deal with eliminating max_k's pair
-        ID=str(max_k)
-        x=related[related.IID1 == ID]
-        l1 = x["IID2"].tolist()
-        x=related[related.IID2 == ID]
-        l2 = x["IID1"].tolist()
-        list_related=l1+l2
-        
-        for i in range(0,len(list_related)):
-            
-            #Remove those who are on related to the selection from both lists
-            if (phenotype[list_related[i]]==1):
-                if list_related[i] in list_cases:
-                    list_cases.remove(list_related[i])
-                    print("should never be ran")
-            if (phenotype[list_related[i]]==0):
-                if list_related[i] in list_controls:
-                    list_controls.remove(list_related[i])
-                    print("should never be ran")
-            if (phenotype[list_related[i]]=="NA"):
-                 if list_related[i] in list_nas:
-                    list_nas.remove(list_related[i])
-                    # We need to access everyone in list_related and change their score
-                    # They have 1 less point because one less case pair. Also have 1 less relative
-                    # This way we don't have to recalculate the score for everyone! 
-                    new_score[str(list_related[i])]=new_score[str(list_related[i])]-1
-                    num_relative[str(list_related[i])]=num_relative[str(list_related[i])]-1
-
-        # eliminate max_k
-        third_add_array.append(max_k)
-        list_nas.remove(str(max_k))
-        index = related[ related['IID1'] == max_k ].index
-        related.drop(index , inplace=True)
-        index = related[ related['IID2'] == max_k ].index
-        related.drop(index , inplace=True)
+    third_add_array = chosen[phenotype[chosen]==-1]
 
     print(f'Number of NAs Selected: {len(third_add_array)}')
     print("")
 
-    # Merge Arrays and Output:
-    final_array=add_array+second_add_array+third_add_array
+    # Merge Arrays and Output. Everyone is still an index here, IIDs are only looked up once for the output
+    final_array = np.concatenate((add_array,second_add_array,third_add_array))
 
-    # Output list:
+    # Output list: selected IIDs followed by the strict unrelateds, joined and written in one call
 
-    with open(args.output, 'w') as f:
-        for i in range(0,len(final_array)):
-            f.write(final_array[i])
-            f.write('\n')    
-        for index, row in unrelated_strict.iterrows():
-            f.write(str(row['IID']))
-            f.write('\n')    
+    output_list = uniques[final_array].tolist() + unrelated_strict.IID.tolist()
+    with open(args.output, 'w', buffering=1<<20) as f:
+        if len(output_list) > 0:
+            f.write('\n'.join(output_list) + '\n')
 
     # Final Output List
     print(f'Final Output File N (Unrelateds chosen by Python Script merged with strict unrelateds): {len(final_array)+len(unrelated_strict.index)}')